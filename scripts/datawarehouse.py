@@ -2,6 +2,8 @@ import os
 import pandas as pd
 import numpy as np
 import unidecode
+from warehouse_snapshot import publish_snapshot
+from fact_changes import publish_changes
 
 # ==========================================
 # CONFIGURATION
@@ -166,6 +168,24 @@ dim_t.to_csv(os.path.join(WAREHOUSE, "dim_temps.csv"), index=False)
 
 fact.to_csv(os.path.join(WAREHOUSE, "fact_orders.csv"), index=False)
 
+# ==========================================
+# FACT CHANGE LOG (incremental KPI refresh)
+# ==========================================
+change_seq, change_counts = publish_changes(fact)
+
+# ==========================================
+# SHARED SNAPSHOT (memory-mapped, for concurrent readers)
+# ==========================================
+version = publish_snapshot({
+    "fact_orders": fact,
+    "dim_customers": dim_c,
+    "dim_employees": dim_e,
+    "dim_temps": dim_t,
+})
+
 print(f"✅ Warehouse Built.")
 print(f"   Total Orders: {len(fact)}")
-print(f"   Date Range: {fact['date'].dt.year.min()} to {fact['date'].dt.year.max()}")
\ No newline at end of file
+print(f"   Date Range: {fact['date'].dt.year.min()} to {fact['date'].dt.year.max()}")
+print(f"   Snapshot: {version}")
+print(f"   Fact changes: {change_counts['added']} new, {change_counts['changed']} changed, "
+      f"{change_counts['removed']} removed" + (f" (batch {change_seq})" if change_seq else ""))
\ No newline at end of file
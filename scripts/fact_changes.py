@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+BASE = os.path.join(os.path.dirname(__file__), "..")
+CHANGES_ROOT = os.path.join(BASE, "data", "warehouse", "fact_changes")
+INDEX_FILE = "fact_index.npz"
+KEEP_BATCHES = 30
+
+# ==========================================
+# HELPERS
+# ==========================================
+def order_keys(fact):
+    """Stable uint64 key per order (source + source order id; fact_key is renumbered on each build)"""
+    keys = fact[["source", "orderid"]].astype(str)
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy(np.uint64)
+
+def list_batches(root=CHANGES_ROOT):
+    """Sequence numbers of the change batches on disk, oldest first"""
+    if not os.path.exists(root):
+        return []
+    return sorted(int(f[:-4]) for f in os.listdir(root) if f.endswith(".csv") and f[:-4].isdigit())
+
+def _batch_path(root, seq):
+    return os.path.join(root, f"{seq:08d}.csv")
+
+# ==========================================
+# WRITER (datawarehouse.py)
+# ==========================================
+def publish_changes(fact, root=CHANGES_ROOT):
+    """Diff a freshly built fact table against the previous build and log the changed orders.
+
+    Upserted orders are written with their full fact row, removed orders with their key only,
+    as one numbered batch. Returns (seq or None, counts).
+    """
+    os.makedirs(root, exist_ok=True)
+    keys = order_keys(fact)
+    row_hashes = pd.util.hash_pandas_object(fact.drop(columns=["fact_key"]), index=False).to_numpy(np.uint64)
+
+    index_path = os.path.join(root, INDEX_FILE)
+    if os.path.exists(index_path):
+        with np.load(index_path) as prev:
+            prev_keys, prev_hashes = prev["keys"], prev["hashes"]
+    else:
+        prev_keys = prev_hashes = np.empty(0, dtype=np.uint64)
+
+    pos = pd.Index(prev_keys).get_indexer(keys)
+    is_new = pos < 0
+    # Trailing 0 gives new orders (position -1) a placeholder hash; they are masked by is_new
+    is_changed = ~is_new & (np.append(prev_hashes, np.uint64(0))[pos] != row_hashes)
+    removed = prev_keys[~np.isin(prev_keys, keys)]
+    counts = {"added": int(is_new.sum()), "changed": int(is_changed.sum()), "removed": len(removed)}
+
+    seq = None
+    if counts["added"] or counts["changed"] or counts["removed"]:
+        upserts = fact[is_new | is_changed].drop(columns=["fact_key"]).assign(
+            order_key=keys[is_new | is_changed], op="upsert")
+        deletes = pd.DataFrame({"order_key": removed, "op": "delete"})
+        batches = list_batches(root)
+        seq = (batches[-1] if batches else 0) + 1
+        tmp = os.path.join(root, f".{seq:08d}.csv.tmp")
+        pd.concat([upserts, deletes], ignore_index=True).to_csv(tmp, index=False)
+        os.replace(tmp, _batch_path(root, seq))
+        for old in batches[:max(len(batches) + 1 - KEEP_BATCHES, 0)]:
+            os.remove(_batch_path(root, old))
+
+    # Written after the batch: if the build dies in between, the next build re-logs the same
+    # changes, which readers apply idempotently (upsert = retract old version + add new one)
+    tmp_index = os.path.join(root, "fact_index.tmp.npz")
+    np.savez(tmp_index, keys=keys, hashes=row_hashes)
+    os.replace(tmp_index, index_path)
+    return seq, counts
+
+# ==========================================
+# READER (kpi_analysis.py)
+# ==========================================
+def read_batches(seqs, root=CHANGES_ROOT):
+    """Load the given batches and keep only the latest operation per order"""
+    frames = [pd.read_csv(_batch_path(root, s), dtype={"orderid": str, "order_key": "uint64"}) for s in seqs]
+    changes = pd.concat(frames, ignore_index=True)
+    return changes.drop_duplicates("order_key", keep="last").reset_index(drop=True)
@@ -1,5 +1,9 @@
 import os
+import sys
+import numpy as np
 import pandas as pd
+from fact_changes import order_keys, list_batches, read_batches
+from warehouse_snapshot import publish_snapshot, open_snapshot
 
 # ==========================================
 # CONFIGURATION
@@ -7,92 +11,212 @@ import pandas as pd
 BASE = os.path.join(os.path.dirname(__file__), "..")
 WH = os.path.join(BASE, "data", "warehouse")
 OUT_DIR = os.path.join(WH, "kpi_summaries")
+# KPI state (ledger + per-group sums) is kept as generations of a snapshot store: a run commits
+# everything at once by swapping the store's CURRENT pointer
+STATE_DIR = os.path.join(OUT_DIR, "state")
 os.makedirs(OUT_DIR, exist_ok=True)
 
 fact_path = os.path.join(WH, "fact_orders.csv")
 dim_c_path = os.path.join(WH, "dim_customers.csv")
 dim_e_path = os.path.join(WH, "dim_employees.csv")
 
-# ==========================================
-# LOAD DATA
-# ==========================================
-print("--- Loading Warehouse Data for KPIs ---")
-if not os.path.exists(fact_path):
-    print("❌ Error: fact_orders.csv not found.")
-    exit()
+# Run with --full to drop the saved state and rebuild every KPI from scratch
+FULL_REFRESH = "--full" in sys.argv
 
-fact = pd.read_csv(fact_path)
-dim_c = pd.read_csv(dim_c_path)
-dim_e = pd.read_csv(dim_e_path)
+# KPI grouping column -> output file
+KPI_GROUPS = {
+    "country": "orders_by_country.csv",
+    "emp_norm": "orders_by_employee.csv",
+    "period": "orders_by_month.csv",
+}
+# "scope" is a single-group column holding the global totals
+STATE_GROUPS = list(KPI_GROUPS) + ["scope"]
+LEDGER_COLUMNS = ["order_key"] + list(KPI_GROUPS) + ["delivered", "revenue"]
+# Revenue sums are kept as integers in 1/10000 units (SQL Server money precision), so
+# incremental updates add up exactly to a full recompute whatever the summation order
+REVENUE_SCALE = 10_000
 
-df = fact.merge(dim_c, on="customer_key", how="left")
-df = df.merge(dim_e, on="employee_key", how="left")
+# ==========================================
+# HELPERS
+# ==========================================
+def empty_ledger():
+    """Ledger of the fact rows folded into the KPI state, one row per order"""
+    ledger = pd.DataFrame({"order_key": pd.Series(dtype="uint64")})
+    for c in KPI_GROUPS:
+        ledger[c] = pd.Categorical([])
+    ledger["delivered"] = pd.Series(dtype="int64")
+    ledger["revenue"] = pd.Series(dtype="float64")
+    return ledger
+
+def empty_state(group_col):
+    """Aggregate state (counts and sums) for one KPI grouping"""
+    state = pd.DataFrame({
+        "total_orders": pd.Series(dtype="int64"),
+        "delivered": pd.Series(dtype="int64"),
+        "total_revenue": pd.Series(dtype="int64"),
+    })
+    state.index = pd.Index([], name=group_col, dtype=object)
+    return state
+
+def load_saved_state(snap):
+    """Read the ledger and group states of one committed generation"""
+    ledger = snap.frame("ledger")
+    states = {}
+    for g in STATE_GROUPS:
+        state = snap.frame(g)
+        state[g] = state[g].astype(str)
+        states[g] = state.set_index(g)
+    return ledger, states
+
+def append_categorical(a, b):
+    """Concatenate two categoricals, extending a's categories instead of re-encoding it"""
+    a, b = pd.Categorical(a), pd.Categorical(b)
+    cats = a.categories.astype(str)
+    b_cats = b.categories.astype(str)
+    cats = cats.append(b_cats.difference(cats))
+    # Trailing -1 maps missing values (code -1) to missing
+    b_codes = np.append(cats.get_indexer(b_cats), -1)[b.codes]
+    return pd.Categorical.from_codes(np.concatenate([a.codes, b_codes]), categories=cats)
+
+def resolve_groups(rows, dim_c, dim_e):
+    """Ledger rows (KPI group values + measures) for upserted fact rows"""
+    df = rows.merge(dim_c[["customer_key", "country"]], on="customer_key", how="left")
+    df = df.merge(dim_e[["employee_key", "emp_norm"]], on="employee_key", how="left")
+    # Format each distinct month once instead of every row
+    d = pd.to_datetime(df["date"])
+    codes, months = pd.factorize(d.dt.year * 100 + d.dt.month)
+    labels = [f"{int(m) // 100:04d}-{int(m) % 100:02d}" for m in months]
+    return pd.DataFrame({
+        "order_key": df["order_key"].to_numpy(np.uint64),
+        "country": pd.Categorical(df["country"]),
+        "emp_norm": pd.Categorical(df["emp_norm"]),
+        "period": pd.Categorical.from_codes(codes, categories=labels),
+        "delivered": df["delivered"].astype("int64").to_numpy(),
+        "revenue": df["revenue"].astype("float64").to_numpy(),
+    })
+
+def build_delta(ledger, new_rows, touched):
+    """Signed delta rows (-1 retracts the ledger version of touched orders, +1 adds new_rows)
+    and the updated ledger"""
+    pos = pd.Index(ledger["order_key"]).get_indexer(touched)
+    pos = pos[pos >= 0]
+    minus = ledger.iloc[pos].assign(sign=-1)
+    plus = new_rows.assign(sign=1)
+    delta = pd.DataFrame({
+        c: append_categorical(minus[c], plus[c]) if c in KPI_GROUPS
+        else np.concatenate([minus[c].to_numpy(), plus[c].to_numpy()])
+        for c in LEDGER_COLUMNS + ["sign"]
+    })
+    delta["scope"] = "all"
+
+    keep = np.ones(len(ledger), dtype=bool)
+    keep[pos] = False
+    kept = ledger[keep]
+    ledger = pd.DataFrame({
+        c: append_categorical(kept[c], new_rows[c]) if c in KPI_GROUPS
+        else np.concatenate([kept[c].to_numpy(), new_rows[c].to_numpy()])
+        for c in LEDGER_COLUMNS
+    })
+    return delta, ledger
+
+def apply_delta(state, delta, group_col):
+    """Fold signed delta rows into the aggregate state of one KPI grouping"""
+    d = delta[delta[group_col].notna()]
+    if not d.empty:
+        change = pd.DataFrame({
+            "total_orders": d["sign"],
+            "delivered": d["delivered"] * d["sign"],
+            "total_revenue": (d["revenue"] * REVENUE_SCALE).round().astype("int64") * d["sign"],
+        }).groupby(d[group_col].astype(str)).sum()
+        state = state.add(change, fill_value=0)
+    state = state[state["total_orders"] > 0].copy()
+    state["total_orders"] = state["total_orders"].astype(int)
+    state["delivered"] = state["delivered"].astype(int)
+    state["total_revenue"] = state["total_revenue"].astype("int64")
+    state.index.name = group_col
+    return state
 
-rename_map = {
-    "country_x": "country",
-    "source_x": "source"
-}
-df = df.rename(columns=rename_map)
+# ==========================================
+# LOAD STATE & PENDING CHANGES
+# ==========================================
+print("--- Loading KPI State ---")
+snap = None
+if not FULL_REFRESH:
+    try:
+        snap = open_snapshot(STATE_DIR)
+    except FileNotFoundError:
+        pass
+
+batches = list_batches()
+latest_seq = batches[-1] if batches else 0
+applied_seq = int(snap.frame("meta")["applied_seq"].iloc[0]) if snap else None
+pending = [s for s in batches if applied_seq is not None and s > applied_seq]
+# Rebuild when there is no state, or the change log no longer connects to it
+rebuild = (snap is None or latest_seq < applied_seq
+           or (pending and pending[0] != applied_seq + 1))
+
+if rebuild:
+    print("   Rebuilding KPI state from the full fact table")
+    if not os.path.exists(fact_path):
+        print("❌ Error: fact_orders.csv not found.")
+        exit()
+    fact = pd.read_csv(fact_path, dtype={"orderid": str})
+    changes = fact.assign(order_key=order_keys(fact), op="upsert")
+    ledger = empty_ledger()
+    states = {g: empty_state(g) for g in STATE_GROUPS}
+else:
+    ledger, states = load_saved_state(snap)
+    changes = read_batches(pending) if pending else None
+    print(f"   State at change batch {applied_seq}, {len(pending)} pending")
 
-df["orderdate"] = pd.to_datetime(df["date"])
+# ==========================================
+# APPLY DELTA
+# ==========================================
+if changes is not None:
+    print("... Applying fact delta")
+    dim_c = pd.read_csv(dim_c_path)
+    dim_e = pd.read_csv(dim_e_path)
+
+    is_delete = changes["op"] == "delete"
+    new_rows = resolve_groups(changes[~is_delete], dim_c, dim_e)
+    delta, ledger = build_delta(ledger, new_rows, changes["order_key"].to_numpy(np.uint64))
+    print(f"   Upserted: {len(new_rows)}  Deleted: {int(is_delete.sum())}")
+
+    states = {g: apply_delta(states[g], delta, g) for g in STATE_GROUPS}
+    tables = {g: states[g].reset_index() for g in STATE_GROUPS}
+    tables["ledger"] = ledger
+    tables["meta"] = pd.DataFrame({"applied_seq": [latest_seq]})
+    publish_snapshot(tables, root=STATE_DIR)
+else:
+    print("   KPIs already up to date")
 
 # ==========================================
 # GLOBAL KPIs
 # ==========================================
-total_orders = len(df)
-delivered = int(df["delivered"].sum())
+totals = states["scope"].reindex(["all"]).fillna(0).iloc[0]
+total_orders = int(totals["total_orders"])
+delivered = int(totals["delivered"])
 not_delivered = total_orders - delivered
 delivered_rate = (delivered / total_orders * 100) if total_orders > 0 else 0
 
 print("\n===== 📊 GLOBAL PERFORMANCE =====")
 print(f"Total Orders:    {total_orders}")
-print(f"Total Revenue:   ${df['revenue'].sum():,.2f}")
+print(f"Total Revenue:   ${totals['total_revenue'] / REVENUE_SCALE:,.2f}")
 print(f"Delivered:       {delivered}")
 print(f"Pending:         {not_delivered}")
 print(f"Delivery Rate:   {delivered_rate:.2f}%")
 
 # ==========================================
-# KPIs BY COUNTRY
+# KPIs BY COUNTRY / EMPLOYEE / MONTH
 # ==========================================
-print("... Calculating Country KPIs")
-orders_by_country = df.groupby('country').agg(
-    total_orders=('fact_key', 'count'), 
-    delivered=('delivered', 'sum'),
-    total_revenue=('revenue', 'sum')
-).reset_index()
-
-orders_by_country['not_delivered'] = orders_by_country['total_orders'] - orders_by_country['delivered']
-orders_by_country = orders_by_country.sort_values('total_orders', ascending=False)
-orders_by_country.to_csv(os.path.join(OUT_DIR, "orders_by_country.csv"), index=False)
-
-# ==========================================
-# KPIs BY EMPLOYEE
-# ==========================================
-print("... Calculating Employee KPIs")
-orders_by_employee = df.groupby('emp_norm').agg(
-    total_orders=('fact_key', 'count'), 
-    delivered=('delivered', 'sum'),
-    total_revenue=('revenue', 'sum')
-).reset_index()
-
-orders_by_employee['not_delivered'] = orders_by_employee['total_orders'] - orders_by_employee['delivered']
-orders_by_employee = orders_by_employee.sort_values('total_orders', ascending=False)
-orders_by_employee.to_csv(os.path.join(OUT_DIR, "orders_by_employee.csv"), index=False)
-
-# ==========================================
-# KPIs BY MONTH
-# ==========================================
-print("... Calculating Timeline")
-df['period'] = df['orderdate'].dt.to_period('M')
-
-orders_by_month = df.groupby('period').agg(
-    total_orders=('fact_key', 'count'), 
-    delivered=('delivered', 'sum'),
-    total_revenue=('revenue', 'sum')
-).reset_index()
-
-orders_by_month['not_delivered'] = orders_by_month['total_orders'] - orders_by_month['delivered']
-orders_by_month = orders_by_month.sort_values('period')
-orders_by_month.to_csv(os.path.join(OUT_DIR, "orders_by_month.csv"), index=False)
-
-print(f"✅ All KPI files saved to: {OUT_DIR}")
\ No newline at end of file
+for group_col, file_name in KPI_GROUPS.items():
+    kpi = states[group_col].reset_index()
+    kpi['total_revenue'] = (kpi['total_revenue'] / REVENUE_SCALE).round(2)
+    kpi['not_delivered'] = kpi['total_orders'] - kpi['delivered']
+    if group_col == "period":
+        kpi = kpi.sort_values('period')
+    else:
+        kpi = kpi.sort_values('total_orders', ascending=False)
+    kpi.to_csv(os.path.join(OUT_DIR, file_name), index=False)
+
+print(f"✅ All KPI files saved to: {OUT_DIR}")
@@ -0,0 +1,145 @@
+import os
+import json
+import shutil
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+BASE = os.path.join(os.path.dirname(__file__), "..")
+SNAPSHOT_ROOT = os.path.join(BASE, "data", "warehouse", "snapshot")
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+KEEP_VERSIONS = 3
+
+# ==========================================
+# WRITER
+# ==========================================
+def _encode_column(series):
+    """Convert a column to fixed-width arrays: (kind, values, dictionary)"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime", series.to_numpy(dtype="datetime64[ns]"), None
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return "numeric", np.ascontiguousarray(series.to_numpy()), None
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories.astype(str)
+        if categories.is_unique:
+            dictionary = np.array(list(categories), dtype="U" if len(categories) else "U1")
+            return "string", series.cat.codes.to_numpy(dtype=np.int32), dictionary
+    # Strings are dictionary-encoded: int32 codes (-1 = missing) + fixed-width unicode dictionary.
+    # Casting first keeps codes and dictionary aligned when e.g. 1 and "1" share one column.
+    as_str = series.astype(str).where(series.notna())
+    codes, uniques = pd.factorize(as_str)
+    dictionary = np.array(list(uniques), dtype="U" if len(uniques) else "U1")
+    return "string", codes.astype(np.int32), dictionary
+
+def publish_snapshot(tables, root=SNAPSHOT_ROOT):
+    """Write an immutable snapshot of {table_name: DataFrame} and make it current atomically"""
+    versions = os.path.join(root, VERSIONS_DIR)
+    os.makedirs(versions, exist_ok=True)
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    tmp_dir = os.path.join(versions, f".tmp-{version}-{os.getpid()}")
+    os.makedirs(tmp_dir)
+
+    manifest = {"version": version, "tables": {}}
+    for name, df in tables.items():
+        os.makedirs(os.path.join(tmp_dir, name))
+        columns = {}
+        for i, col in enumerate(df.columns):
+            kind, values, dictionary = _encode_column(df[col])
+            np.save(os.path.join(tmp_dir, name, f"{i}.npy"), values)
+            if dictionary is not None:
+                np.save(os.path.join(tmp_dir, name, f"{i}.dict.npy"), dictionary)
+            columns[col] = {"file": f"{i}.npy", "kind": kind, "dtype": str(values.dtype)}
+        manifest["tables"][name] = {"rows": len(df), "columns": columns}
+
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    # Readers only ever see complete versions: rename the finished directory, then swap the pointer
+    os.rename(tmp_dir, os.path.join(versions, version))
+    pointer_tmp = os.path.join(root, f".{CURRENT_FILE}.{os.getpid()}")
+    with open(pointer_tmp, "w") as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(root, CURRENT_FILE))
+
+    _prune_versions(versions, version)
+    return version
+
+def _prune_versions(versions, current):
+    """Drop old versions beyond KEEP_VERSIONS (open readers keep their mappings on POSIX)"""
+    old = sorted(v for v in os.listdir(versions) if not v.startswith(".") and v != current)
+    for v in old[:max(len(old) - (KEEP_VERSIONS - 1), 0)]:
+        shutil.rmtree(os.path.join(versions, v), ignore_errors=True)
+
+# ==========================================
+# READER
+# ==========================================
+class WarehouseSnapshot:
+    """Read-only, memory-mapped view of one published snapshot version.
+
+    Every column file is mapped when the snapshot is opened, so the reader keeps
+    working on its version even after newer builds prune it from disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        self.version = self.manifest["version"]
+        self._cache = {}
+        for table, meta in self.manifest["tables"].items():
+            for col_meta in meta["columns"].values():
+                self._load(table, col_meta["file"])
+                if col_meta["kind"] == "string":
+                    self._load(table, col_meta["file"].replace(".npy", ".dict.npy"))
+
+    @property
+    def tables(self):
+        return list(self.manifest["tables"])
+
+    def columns(self, table):
+        return list(self.manifest["tables"][table]["columns"])
+
+    def _load(self, table, file_name):
+        key = (table, file_name)
+        if key not in self._cache:
+            self._cache[key] = np.load(os.path.join(self.path, table, file_name), mmap_mode="r")
+        return self._cache[key]
+
+    def column(self, table, col):
+        """Zero-copy array for a column (dictionary codes for string columns)"""
+        return self._load(table, self.manifest["tables"][table]["columns"][col]["file"])
+
+    def dictionary(self, table, col):
+        """Zero-copy dictionary for a string column"""
+        meta = self.manifest["tables"][table]["columns"][col]
+        if meta["kind"] != "string":
+            raise ValueError(f"{table}.{col} is not a dictionary-encoded column")
+        return self._load(table, meta["file"].replace(".npy", ".dict.npy"))
+
+    def frame(self, table, columns=None):
+        """Build a DataFrame; numeric columns wrap the mapping, strings become Categoricals"""
+        data = {}
+        for col in columns or self.columns(table):
+            meta = self.manifest["tables"][table]["columns"][col]
+            values = self.column(table, col)
+            if meta["kind"] == "string":
+                data[col] = pd.Categorical.from_codes(values, categories=self.dictionary(table, col))
+            else:
+                data[col] = values
+        return pd.DataFrame(data, copy=False)
+
+def open_snapshot(root=SNAPSHOT_ROOT, version=None):
+    """Open the current (or a given) snapshot version without copying any column data"""
+    if version is None:
+        pointer = os.path.join(root, CURRENT_FILE)
+        if not os.path.exists(pointer):
+            raise FileNotFoundError(f"No warehouse snapshot published under {root}")
+        with open(pointer) as f:
+            version = f.read().strip()
+    return WarehouseSnapshot(os.path.join(root, VERSIONS_DIR, version))